@@ -1,9 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import sys
+import json
+import asyncio
+import hashlib
+import secrets
 from pathlib import Path
 from dotenv import load_dotenv
+from typing import Optional, Tuple
 
 # Add the backend directory to the path
 backend_dir = str(Path(__file__).parent.parent.absolute())
@@ -22,9 +28,11 @@ if missing_vars:
     raise EnvironmentError(f"Missing or invalid required environment variables: {', '.join(missing_vars)}")
 
 from app.services.chat import ChatService
-from app.services.memory import MemoryService
+from app.services.memory import MemoryService, MAX_UPSERT_BATCH
 from app.services.agent import run_agent
-from app.models import ChatRequest, ChatResponse, Memory, ClearMemoriesRequest
+from app.services.idempotency import RequestCoalescer
+from app.services.answer_cache import SemanticAnswerCache
+from app.models import ChatRequest, ChatResponse, Memory, ClearMemoriesRequest, HistoryMessage, HistoryResponse
 
 app = FastAPI(
     title="Chatbot with Memory API",
@@ -44,6 +52,69 @@ app.add_middleware(
 # Initialize services
 memory_service = MemoryService()
 chat_service = ChatService()  # No need to pass memory_service for now
+chat_coalescer = RequestCoalescer(ttl=float(os.getenv("IDEMPOTENCY_TTL_S", "300")))
+# Opt-in reuse of answers to repeated questions that need no memory
+answer_cache = None
+if os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"):
+    answer_cache = SemanticAnswerCache(
+        memory_service.embedding,
+        ttl=float(os.getenv("ANSWER_CACHE_TTL_S", "3600")),
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    )
+
+async def process_chat(chat_request: ChatRequest) -> Tuple[ChatResponse, bool]:
+    """Run one chat turn through the agent (or straight to the model without memory).
+
+    Also returns whether the turn completed without errors; the agent reports
+    failures as a normal reply, which must not be replayed to retries.
+    """
+    print("Processing message with chat service...")
+    response = ""
+    degraded = []
+    cached = False
+    succeeded = True
+    if chat_request.use_memory == True:
+        agent_response = await run_agent(
+            chat_request.message,
+            chat_service,
+            memory_service,
+            chat_request.user_id,
+            deadline_ms=chat_request.deadline_ms,
+            answer_cache=answer_cache
+        )
+        response = agent_response.get('reply', '')
+        degraded = agent_response.get('degraded', [])
+        cached = agent_response.get('answer_cached', False)
+        succeeded = agent_response.get('error_count', 0) == 0
+    else:
+        if answer_cache is not None:
+            response = await answer_cache.get(chat_request.message)
+            cached = response is not None
+        if not cached:
+            prompt = f""" You are a helpful AI assistant. Respond to the user's message without using memory.
+            User's message: {chat_request.message}"""
+            response = await chat_service.generate(prompt, [])
+            if answer_cache is not None:
+                await answer_cache.put(chat_request.message, response)
+    print("Message processed successfully")
+    print(f"Response: {response}")
+    
+    # Format the response according to ChatResponse model
+    return ChatResponse(
+        response=response,
+        used_memory=chat_request.use_memory,
+        relevant_memories=[],
+        degraded=degraded,
+        cached=cached
+    ), succeeded
+
+def coalescing_key(chat_request: ChatRequest) -> str:
+    """Key identifying duplicate /chat requests, always scoped to the user"""
+    if chat_request.idempotency_key:
+        return f"{chat_request.user_id}:key:{chat_request.idempotency_key}"
+    digest = hashlib.sha256(chat_request.message.encode("utf-8")).hexdigest()
+    return f"{chat_request.user_id}:{chat_request.use_memory}:{digest}"
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(chat_request: ChatRequest):
@@ -54,24 +125,16 @@ async def chat(chat_request: ChatRequest):
     print(f"Use Memory: {chat_request.use_memory}")
     
     try:
-        print("Processing message with chat service...")
-        response = ""
-        if chat_request.use_memory == True:
-            agent_response = await run_agent(chat_request.message, chat_service, memory_service, chat_request.user_id)
-            response = agent_response.get('reply', '')
-        else:
-            prompt = """ You are a helpful AI assistant. Respond to the user's message without using memory.
-            User's message: {message}"""
-            response = await chat_service.generate(prompt, [])
-        print("Message processed successfully")
-        print(f"Response: {response}")
-        
-        # Format the response according to ChatResponse model
-        return ChatResponse(
-            response=response,
-            used_memory=chat_request.use_memory,
-            relevant_memories=[]
+        # Identical requests in flight share one run; keyed results of turns that
+        # succeeded are also cached for a while so client retries do not store the
+        # turn twice, while a resend after a failure runs the turn again
+        response, _ = await chat_coalescer.run(
+            coalescing_key(chat_request),
+            lambda: process_chat(chat_request),
+            cache_result=chat_request.idempotency_key is not None,
+            cache_if=lambda result: result[1]
         )
+        return response
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
@@ -108,6 +171,159 @@ async def clear_memories(request: ClearMemoriesRequest):
         print(f"Error clearing memories: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/history", response_model=HistoryResponse)
+async def history(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[float] = None,
+    before_id: Optional[str] = None
+):
+    """Return a page of a user's stored conversation, newest page first"""
+    try:
+        entries, has_more = await memory_service.get_history_page(
+            user_id, limit=limit, before=before, before_id=before_id
+        )
+        oldest = entries[0] if has_more and entries else None
+        return HistoryResponse(
+            messages=[
+                HistoryMessage(role=e['role'], content=e['content'], timestamp=e['timestamp'])
+                for e in entries
+            ],
+            next_before=oldest['timestamp'] if oldest else None,
+            next_before_id=oldest['id'] if oldest else None
+        )
+    except Exception as e:
+        print(f"Error fetching history: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Guard for the bulk endpoints, which read and write any user's memories"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Bulk memory endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token header")
+
+@app.get("/memories/export", dependencies=[Depends(require_admin)])
+async def export_memories(
+    user_id: Optional[str] = None,
+    page_size: int = Query(100, ge=1, le=100),
+    start_namespace: Optional[str] = None,
+    pagination_token: Optional[str] = None
+):
+    """Stream memories as NDJSON, one record per line.
+
+    Exports one user's namespace, or every namespace when user_id is omitted.
+    Interleaved {"checkpoint": ...} lines carry the start_namespace and
+    pagination_token to pass back in to resume an interrupted export.
+    """
+    async def generate():
+        exported = 0
+        async for item in memory_service.export_records(
+            user_id=user_id,
+            page_size=page_size,
+            start_namespace=start_namespace or user_id,
+            pagination_token=pagination_token
+        ):
+            if "checkpoint" not in item:
+                exported += 1
+            yield json.dumps(item) + "\n"
+        yield json.dumps({"done": True, "exported": exported}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/memories/import", dependencies=[Depends(require_admin)])
+async def import_memories(
+    request: Request,
+    user_id: Optional[str] = None,
+    batch_size: int = Query(MAX_UPSERT_BATCH, ge=1, le=MAX_UPSERT_BATCH),
+    concurrency: int = Query(4, ge=1, le=32),
+    resume_from: int = Query(0, ge=0)
+):
+    """Import memories from an NDJSON request body (the /memories/export format).
+
+    Records are upserted in batches, with up to `concurrency` batches in flight.
+    Records keep their IDs (records without one get an ID derived from their
+    namespace, timestamp, role and text), so replaying lines is harmless. The returned
+    checkpoint is the last line number fully written; send the same file again
+    with resume_from=<checkpoint> to continue after a failure. When user_id is
+    given every record goes into that namespace instead of its own.
+    """
+    imported = 0
+    checkpoint = resume_from
+    line_number = 0
+    window = []  # (namespace, records, last line number) batches waiting to be sent
+    batch, batch_namespace, batch_last_line = [], None, 0
+
+    async def flush_window():
+        nonlocal imported, checkpoint
+        if not window:
+            return
+        counts = await asyncio.gather(
+            *(memory_service.import_records(records, namespace) for namespace, records, _ in window)
+        )
+        imported += sum(counts)
+        checkpoint = window[-1][2]
+        window.clear()
+
+    async def close_batch():
+        nonlocal batch
+        if batch:
+            window.append((batch_namespace, batch, batch_last_line))
+            batch = []
+        if len(window) >= concurrency:
+            await flush_window()
+
+    async def lines():
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                yield line
+        if buffer:
+            yield buffer
+
+    try:
+        async for raw in lines():
+            line_number += 1
+            if line_number <= resume_from or not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError:
+                raise HTTPException(
+                    status_code=400,
+                    detail={"error_message": f"Invalid JSON on line {line_number}", "checkpoint": checkpoint, "imported": imported}
+                )
+            # Checkpoint and summary lines from an export carry no memory
+            if "chunk_text" not in record:
+                continue
+            namespace = user_id or record.get("namespace")
+            if not namespace:
+                raise HTTPException(
+                    status_code=400,
+                    detail={"error_message": f"No namespace for line {line_number}", "checkpoint": checkpoint, "imported": imported}
+                )
+            if namespace != batch_namespace:
+                await close_batch()
+                batch_namespace = namespace
+            batch.append(record)
+            batch_last_line = line_number
+            if len(batch) >= batch_size:
+                await close_batch()
+        await close_batch()
+        await flush_window()
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error importing memories: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error_message": str(e), "checkpoint": checkpoint, "imported": imported}
+        )
+    return {"status": "success", "imported": imported, "checkpoint": line_number}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 from enum import Enum
@@ -22,11 +22,19 @@ class ChatRequest(BaseModel):
     user_id: str
     message: str
     use_memory: bool = True
+    # Time budget for the whole turn; the server default applies when omitted
+    deadline_ms: Optional[int] = Field(default=None, gt=0)
+    # Client-chosen key; repeats of the same key return the first result
+    idempotency_key: Optional[str] = Field(default=None, max_length=128)
 
 class ChatResponse(BaseModel):
     response: str
     used_memory: bool = False
     relevant_memories: List[str] = []
+    # Steps skipped or cut short to stay within the deadline
+    degraded: List[str] = []
+    # Answer reused from the semantic answer cache instead of a model call
+    cached: bool = False
 
 class Memory(BaseModel):
     user_id: str
@@ -42,4 +50,15 @@ class Memory(BaseModel):
 
 
 class ClearMemoriesRequest(BaseModel):
-    user_id: str
\ No newline at end of file
+    user_id: str
+
+class HistoryMessage(BaseModel):
+    role: str
+    content: str
+    timestamp: float = 0
+
+class HistoryResponse(BaseModel):
+    messages: List[HistoryMessage] = []
+    # Pass as `before` and `before_id` to load the previous page; None when there is nothing older
+    next_before: Optional[float] = None
+    next_before_id: Optional[str] = None
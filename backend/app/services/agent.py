@@ -2,10 +2,14 @@ from typing import TypedDict, List, Dict, Any, Optional
 from langgraph.graph import StateGraph, END
 from app.services.chat import ChatService
 from app.services.memory import MemoryService
+from app.services.answer_cache import SemanticAnswerCache
 import logging
 from datetime import datetime
 from pydantic import BaseModel, Field
 from uuid import uuid4
+import asyncio
+import os
+import time
 
 # Configure structured logging
 logging.basicConfig(
@@ -14,6 +18,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ------------------------------
+# Latency budget
+# ------------------------------
+# Default time budget for one turn when the client does not send deadline_ms
+DEFAULT_DEADLINE_MS = int(os.getenv("CHAT_DEADLINE_MS", "20000"))
+# Seconds kept back for generating and storing the reply, which always runs
+RESPOND_RESERVE_S = float(os.getenv("CHAT_RESPOND_RESERVE_S", "6"))
+# Spare seconds (beyond the reserve) each optional step needs before it is attempted
+ROUTER_MIN_S = 2.0
+QUERY_GENERATOR_MIN_S = 2.0
+FETCH_MEMORY_MIN_S = 0.5
+# Below this much spare time memory search runs with a reduced top_k
+FETCH_FULL_TOP_K_MIN_S = 2.0
+REDUCED_TOP_K = 2
+
+# ------------------------------
+# Retrieval settings (see eval/retrieval_eval.py for the latency/recall tradeoff)
+# ------------------------------
+# Memories fetched per search query
+FULL_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+# Most recent messages passed to the model as conversation history
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "15"))
+# Generated search queries actually run against the memory store
+MAX_SEARCH_QUERIES = int(os.getenv("MAX_SEARCH_QUERIES", "3"))
+
 # ------------------------------
 # Data Models
 # ------------------------------
@@ -36,6 +65,9 @@ class AgentState(TypedDict):
     memory_hits: List[str]
     error_count: int
     last_error: Optional[str]
+    deadline: float
+    degraded: List[str]
+    answer_cached: bool
 
 # ------------------------------
 # Agent Implementation
@@ -47,13 +79,15 @@ class Agent:
         memory_store: MemoryService,
         user_id: str,
         history: List,
-        exclude_ids: List[str]
+        exclude_ids: List[str],
+        answer_cache: Optional[SemanticAnswerCache] = None
     ):
         self.chat_service = chat_service
         self.memory_store = memory_store
         self.user_id = user_id
         self.history = history
         self.exclude_ids = exclude_ids
+        self.answer_cache = answer_cache
         self.graph = self._build_graph()
 
     def _build_graph(self) -> StateGraph:
@@ -74,7 +108,20 @@ class Agent:
         builder.set_entry_point("router")
         return builder.compile()
 
+    def _spare_time(self, state: AgentState) -> float:
+        """Seconds left before the deadline once the reply reserve is set aside"""
+        return state["deadline"] - time.monotonic() - RESPOND_RESERVE_S
+
+    def _degrade(self, state: AgentState, step: str) -> None:
+        if step not in state["degraded"]:
+            state["degraded"].append(step)
+        print(f"Deadline: degrading '{step}' ({self._spare_time(state):.2f}s spare)")
+
     async def _router(self, state: AgentState) -> AgentState:
+        if self._spare_time(state) < ROUTER_MIN_S:
+            state["needs_memory"] = False
+            self._degrade(state, "memory")
+            return state
         try:
             prompt = f"""
                 You are an assistant that decides whether the user's current question requires retrieving older long-term memories to be answered effectively.
@@ -100,11 +147,19 @@ class Agent:
 
                 Make a careful judgment based on both the current question and history. Use the `check_memory_necessity` function to return the result. DO NOT include any other text or explanations in your response.
                 """
-            result = await self.chat_service.call_function(
-                name="check_memory_necessity",
-                prompt=prompt,
-                type="check_memory_necessity"
-            )
+            try:
+                result = await asyncio.wait_for(
+                    self.chat_service.call_function(
+                        name="check_memory_necessity",
+                        prompt=prompt,
+                        type="check_memory_necessity"
+                    ),
+                    timeout=self._spare_time(state)
+                )
+            except asyncio.TimeoutError:
+                state["needs_memory"] = False
+                self._degrade(state, "memory")
+                return state
             try:
                 state["needs_memory"] = result.args["needs_memory"]
             except KeyError:
@@ -114,6 +169,10 @@ class Agent:
             return self._handle_error(state, e)
 
     async def _query_generator(self, state: AgentState) -> AgentState:
+        if self._spare_time(state) < QUERY_GENERATOR_MIN_S:
+            state["search_queries"] = [state["current_input"]]
+            self._degrade(state, "query_generation")
+            return state
         try:
             # create a prompt to use the history along with the user input to check if there is a need for checking for memories
             prompt = f"""
@@ -138,13 +197,21 @@ class Agent:
 
                     You MUST use the function `generate_search_queries` to return your results Do NOT include any other text or explanations in your response."""
                 
-            result = await self.chat_service.call_function(
-                name="generate_search_queries",
-                prompt=prompt,
-                type="generate_search_queries"
-            )
             try:
-                state["search_queries"] = result.args["queries"]
+                result = await asyncio.wait_for(
+                    self.chat_service.call_function(
+                        name="generate_search_queries",
+                        prompt=prompt,
+                        type="generate_search_queries"
+                    ),
+                    timeout=self._spare_time(state)
+                )
+            except asyncio.TimeoutError:
+                state["search_queries"] = [state["current_input"]]
+                self._degrade(state, "query_generation")
+                return state
+            try:
+                state["search_queries"] = list(result.args["queries"])[:MAX_SEARCH_QUERIES]
             except KeyError:
                 state["search_queries"] = [state["current_input"]]
             return state
@@ -155,8 +222,40 @@ class Agent:
 
     async def _fetch_memory(self, state: AgentState) -> AgentState:
         try:
-            for q in state.get("search_queries", []):
-                results = await self.memory_store.search_memories(self.user_id,q, exclude_ids=self.exclude_ids)
+            queries = state.get("search_queries", [])
+            if not queries:
+                return state
+            if self._spare_time(state) < FETCH_MEMORY_MIN_S:
+                self._degrade(state, "memory")
+                return state
+            # Embed every query in one call; repeats (e.g. the raw input fallback) hit the cache
+            try:
+                vectors = await asyncio.wait_for(
+                    self.memory_store.embedding.embed(queries, "query"),
+                    timeout=self._spare_time(state)
+                )
+            except asyncio.TimeoutError:
+                self._degrade(state, "memory")
+                return state
+            for q, vector in zip(queries, vectors):
+                spare = self._spare_time(state)
+                if spare < FETCH_MEMORY_MIN_S:
+                    self._degrade(state, "memory")
+                    break
+                top_k = FULL_TOP_K
+                if spare < FETCH_FULL_TOP_K_MIN_S:
+                    top_k = REDUCED_TOP_K
+                    self._degrade(state, "top_k")
+                try:
+                    results = await asyncio.wait_for(
+                        self.memory_store.search_memories(
+                            self.user_id, q, limit=top_k, exclude_ids=self.exclude_ids, vector=vector
+                        ),
+                        timeout=spare
+                    )
+                except asyncio.TimeoutError:
+                    self._degrade(state, "memory")
+                    break
                 for mem in results:
                     self.exclude_ids.append(mem["_id"])
                     state["memory_hits"].append(mem["fields"]["chunk_text"])
@@ -188,20 +287,28 @@ class Agent:
                 Now respond to the user.
                 """
             
-            await self.memory_store.store_memory(
+            user_timestamp = datetime.now().timestamp()
+            # With no memory and no history the reply depends on the question alone;
+            # history dropped for the deadline does not count as having none
+            cacheable = (self.answer_cache is not None and not state["needs_memory"] and not self.history
+                         and "history" not in state["degraded"])
+            response = await self.answer_cache.get(state["current_input"]) if cacheable else None
+            if response is not None:
+                state["answer_cached"] = True
+            else:
+                response = await self.chat_service.generate(
+                    prompt=prompt,
+                    history=self.history
+                )
+                if cacheable:
+                    await self.answer_cache.put(state["current_input"], response)
+            # Both turns are embedded together and written in one upsert
+            await self.memory_store.store_memories(
                 user_id=self.user_id,
-                role="user",
-                content=state["current_input"]
-            )
-            print("I got here")
-            response = await self.chat_service.generate(
-                prompt=prompt,
-                history=self.history
-            )
-            await self.memory_store.store_memory(
-                user_id=self.user_id,
-                role="model",
-                content=response
+                messages=[
+                    {"role": "user", "content": state["current_input"], "timestamp": user_timestamp},
+                    {"role": "model", "content": response}
+                ]
             )
             state["messages"].append(
                 Message(role="model", content=response)
@@ -226,8 +333,11 @@ async def run_agent(
     user_input: str,
     chat_service: ChatService,
     memory_store: MemoryService,
-    user_id: str
+    user_id: str,
+    deadline_ms: Optional[int] = None,
+    answer_cache: Optional[SemanticAnswerCache] = None
 ) -> Dict[str, Any]:
+    deadline = time.monotonic() + (deadline_ms or DEFAULT_DEADLINE_MS) / 1000
     state: AgentState = {
         "messages": [],
         "current_input": user_input,
@@ -236,10 +346,22 @@ async def run_agent(
         "memory_hits": [],
         "error_count": 0,
         "last_error": None,
+        "deadline": deadline,
+        "degraded": [],
+        "answer_cached": False,
     }
     print("GETTING HISTORY")
-    history, exclude_ids = await memory_store.get_history(user_id)
-    agent = Agent(chat_service, memory_store, user_id, history, exclude_ids)
+    try:
+        history, exclude_ids = await asyncio.wait_for(
+            memory_store.get_history(user_id, limit=HISTORY_LIMIT),
+            timeout=max(deadline - time.monotonic() - RESPOND_RESERVE_S, 0)
+        )
+    except asyncio.TimeoutError:
+        # Answer without history rather than spend the reply's reserve waiting for it
+        history, exclude_ids = [], []
+        state["degraded"].append("history")
+        print("Deadline: degrading 'history'")
+    agent = Agent(chat_service, memory_store, user_id, history, exclude_ids, answer_cache)
     final = await agent.graph.ainvoke(state)
     reply = final["messages"][-1].content if final["messages"] else ""
     return {
@@ -248,4 +370,6 @@ async def run_agent(
         "memory_hits": [m for m in final.get("memory_hits", [])],
         "error_count": final["error_count"],
         "last_error": final["last_error"],
+        "degraded": final["degraded"],
+        "answer_cached": final["answer_cached"],
     }
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.services.embedding import EmbeddingService
+
+
+class SemanticAnswerCache:
+    """Reuses model answers to standalone questions asked again.
+
+    Only meant for turns answered without memory or history, where the reply
+    depends on the question alone. A lookup first tries the normalized text,
+    then the closest cached question by embedding cosine similarity. Entries
+    expire after `ttl` seconds and the least recently used are evicted beyond
+    `max_entries`. Failures (e.g. a failed embedding call) count as a miss so
+    callers always fall back to the model.
+    """
+
+    def __init__(self, embedding: EmbeddingService, ttl: float = 3600, max_entries: int = 1000,
+                 threshold: float = 0.95):
+        self.embedding = embedding
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        # normalized question -> (expires_at, unit-length question vector, answer)
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray, str]]" = OrderedDict()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase, collapse whitespace and drop trailing ?, . and !
+
+        Symbols inside the question are kept: "2+2" and "2*2", or "C++" and "C",
+        are different questions and must not share an exact-match key.
+        """
+        return " ".join(text.lower().split()).rstrip("?.! ")
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _, _) in self._entries.items() if expires_at < now]:
+            del self._entries[key]
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        """Normalise once on insert so a lookup is a single matrix-vector product"""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    async def get(self, question: str) -> Optional[str]:
+        """Return a cached answer for this or a near-identical question, if any"""
+        try:
+            return await self._lookup(question)
+        except Exception as e:
+            print(f"Answer cache lookup failed, treating as a miss: {str(e)}")
+            return None
+
+    async def put(self, question: str, answer: str) -> None:
+        try:
+            await self._store(question, answer)
+        except Exception as e:
+            print(f"Answer cache store failed: {str(e)}")
+
+    async def _lookup(self, question: str) -> Optional[str]:
+        self._purge_expired()
+        key = self.normalize(question)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            print(f"Answer cache: exact hit for '{key}'")
+            return self._entries[key][2]
+        if not self._entries:
+            return None
+
+        vector = self._unit((await self.embedding.embed([question], "query"))[0])
+        keys = list(self._entries.keys())
+        scores = np.stack([self._entries[key][1] for key in keys]) @ vector
+        best = int(np.argmax(scores))
+        best_key, best_score = keys[best], float(scores[best])
+        if best_score < self.threshold:
+            return None
+        self._entries.move_to_end(best_key)
+        print(f"Answer cache: semantic hit for '{key}' -> '{best_key}' ({best_score:.3f})")
+        return self._entries[best_key][2]
+
+    async def _store(self, question: str, answer: str) -> None:
+        vector = self._unit((await self.embedding.embed([question], "query"))[0])
+        key = self.normalize(question)
+        self._entries[key] = (time.monotonic() + self.ttl, vector, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Stored values must be JSON-serialisable so every backend behaves the same
+# Generation counters are kept apart from cached values: they are never evicted
+# or expired and do not count toward max_entries, so a counter can only go up
+
+
+class Cache:
+    """Small key/value cache with per-entry TTL"""
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> None:
+        raise NotImplementedError
+
+    def generation(self, key: str) -> int:
+        """Current value of a generation counter (0 if never bumped)"""
+        raise NotImplementedError
+
+    def bump_generation(self, key: str) -> int:
+        """Atomically add one to a generation counter and return the new value"""
+        raise NotImplementedError
+
+
+class NullCache(Cache):
+    """Caches nothing; used when caching is turned off"""
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def delete_prefix(self, prefix: str) -> None:
+        pass
+
+    def generation(self, key: str) -> int:
+        return 0
+
+    def bump_generation(self, key: str) -> int:
+        return 0
+
+
+class InProcessCache(Cache):
+    """LRU cache private to one worker process"""
+
+    def __init__(self, max_entries: int = 10000, default_ttl: float = 300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # key -> (expires_at, JSON-encoded value)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(entry[1])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + (ttl or self.default_ttl), json.dumps(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def bump_generation(self, key: str) -> int:
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            return self._generations[key]
+
+
+class SharedCache(Cache):
+    """Cache shared by every worker on the host, kept in a local SQLite file.
+
+    WAL mode lets readers in all workers proceed while one writes. Reads do not
+    write, so eviction is by soonest expiry rather than strict LRU; it runs every
+    `evict_every` writes once the table grows past `max_entries`. Generation
+    counters live in their own table, which eviction never touches.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, default_ttl: float = 300, evict_every: int = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + (ttl or self.default_ttl))
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        # Range scan on the primary key instead of LIKE, so no escaping is needed
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, upper))
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM generations WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, key: str) -> int:
+        with self._lock:
+            (value,) = self._conn.execute(
+                "INSERT INTO generations (key, value) VALUES (?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value",
+                (key,)
+            ).fetchone()
+        return value
+
+
+def create_cache() -> Cache:
+    """Build the cache selected by CACHE_BACKEND: shared (default), memory or none"""
+    backend = os.getenv("CACHE_BACKEND", "shared").lower()
+    max_entries = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+    default_ttl = float(os.getenv("CACHE_TTL_S", "300"))
+    if backend == "none":
+        return NullCache()
+    if backend == "memory":
+        return InProcessCache(max_entries=max_entries, default_ttl=default_ttl)
+    if backend == "shared":
+        path = os.getenv("CACHE_PATH", os.path.join(tempfile.gettempdir(), "chatbot-with-memory-cache.sqlite3"))
+        print(f"Using shared cache at: {path}")
+        return SharedCache(path, max_entries=max_entries, default_ttl=default_ttl)
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
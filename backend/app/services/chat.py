@@ -60,7 +60,7 @@ class ChatService:
         """
         tool = types.Tool(function_declarations=[FUNCTION_DEFINITIONS[name]])
 
-        response = self.model.generate_content(prompt, tools=[tool])
+        response = await self.model.generate_content_async(prompt, tools=[tool])
         print(response)
         if response.candidates[0].content.parts[0].function_call:
             print("Function call found")
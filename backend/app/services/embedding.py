@@ -0,0 +1,63 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+# Must match the model the index was created with in MemoryService
+EMBED_MODEL = "llama-text-embed-v2"
+
+EmbedFn = Callable[[List[str], str], List[List[float]]]
+
+
+class EmbeddingService:
+    """Embeds text once and remembers it.
+
+    Vectors are cached in an LRU keyed by a hash of (model, input_type, text), and
+    every cache miss in an `embed` call goes out in a single batched request.
+    llama-text-embed-v2 embeds queries and passages differently, so the input
+    type is part of the key and one call covers one input type.
+    """
+
+    def __init__(self, embed_fn: Optional[EmbedFn] = None, pinecone=None, model: str = EMBED_MODEL,
+                 max_entries: Optional[int] = None):
+        self.model = model
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+        self.calls = 0
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        if embed_fn is None:
+            def embed_fn(texts: List[str], input_type: str) -> List[List[float]]:
+                result = pinecone.inference.embed(
+                    model=model,
+                    inputs=texts,
+                    parameters={"input_type": input_type, "truncate": "END"}
+                )
+                return [embedding.values for embedding in result.data]
+        self._embed_fn = embed_fn
+
+    def _key(self, text: str, input_type: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{input_type}\0{text}".encode("utf-8")).hexdigest()
+
+    async def embed(self, texts: List[str], input_type: str = "passage") -> List[List[float]]:
+        """Return one vector per text, embedding only the ones not already cached"""
+        keys = [self._key(text, input_type) for text in texts]
+        vectors = {}
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                vectors[key] = self._cache[key]
+            else:
+                misses[key] = text
+
+        if misses:
+            self.calls += 1
+            print(f"Embedding {len(misses)} {input_type} text(s), {len(vectors)} cached")
+            embedded = await asyncio.to_thread(self._embed_fn, list(misses.values()), input_type)
+            for key, vector in zip(misses.keys(), embedded):
+                vectors[key] = vector
+                self._cache[key] = vector
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+        return [vectors[key] for key in keys]
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class RequestCoalescer:
+    """Runs identical requests once.
+
+    Callers that arrive while a request with the same key is still running wait
+    for that leader's result instead of doing the work again. When asked to,
+    the result is also kept for `ttl` seconds so later retries get the same answer.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._results: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def _get_cached(self, key: str) -> Tuple[bool, Any]:
+        entry = self._results.get(key)
+        if entry is None:
+            return False, None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._results[key]
+            return False, None
+        return True, result
+
+    def _store(self, key: str, result: Any) -> None:
+        self._results[key] = (time.monotonic() + self.ttl, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]], cache_result: bool = True,
+                  cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return the result for `key`, calling `factory` only if no one else is already doing so.
+
+        With `cache_if`, a result is only kept when the predicate accepts it, so a
+        failure reported as a normal result is not replayed to retries.
+        """
+        found, result = self._get_cached(key)
+        if found:
+            print(f"Idempotency: returning cached result for {key}")
+            return result
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            print(f"Idempotency: waiting on in-flight request for {key}")
+            # Shield so a follower disconnecting does not cancel the leader's work
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if cache_result and (cache_if is None or cache_if(result)):
+                self._store(key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
@@ -0,0 +1,147 @@
+import math
+import re
+import zlib
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+# Common words carry no topical signal and are left out of the embedding
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "did", "do", "does", "for",
+    "from", "had", "has", "have", "i", "i'm", "in", "is", "it", "its", "me", "my", "of",
+    "on", "or", "so", "that", "the", "this", "to", "was", "we", "what", "when", "where",
+    "which", "who", "why", "with", "you", "your"
+}
+
+
+def hash_embed(text: str, dimension: int = 512) -> List[float]:
+    """Cheap deterministic bag-of-words embedding (hashed, signed, L2-normalised)"""
+    vector = [0.0] * dimension
+    for token in re.findall(r"[a-z0-9']+", text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        h = zlib.crc32(token.encode("utf-8"))
+        vector[h % dimension] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+def local_embed(texts: List[str], input_type: str = "passage") -> List[List[float]]:
+    """Embed function for EmbeddingService when running against LocalIndex"""
+    return [hash_embed(text) for text in texts]
+
+
+def _matches(metadata: dict, filter_dict: Optional[dict]) -> bool:
+    """Evaluate the subset of Pinecone metadata filters this app uses"""
+    for field, condition in (filter_dict or {}).items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$nin" in condition and value in condition["$nin"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class LocalIndex:
+    """In-memory stand-in for the Pinecone index used by MemoryService.
+
+    Implements the calls MemoryService makes against the index: vector upserts
+    and queries, plus the integrated-embedding record API, for which `chunk_text`
+    is embedded locally with hash_embed. Every call is counted in `calls` so
+    callers can estimate round trips against the real service.
+    """
+
+    def __init__(self, dimension: int = 512, page_size: int = 100):
+        self.dimension = dimension
+        self.page_size = page_size
+        self.calls = 0
+        self._namespaces: Dict[str, Dict[str, dict]] = {}
+
+    def _embed(self, text: str) -> List[float]:
+        return hash_embed(text, self.dimension)
+
+    def upsert_records(self, records: List[dict], namespace: str) -> None:
+        self.calls += 1
+        store = self._namespaces.setdefault(namespace, {})
+        for record in records:
+            metadata = {k: v for k, v in record.items() if k not in ("id", "_id")}
+            store[record.get("id") or record["_id"]] = {
+                "values": self._embed(record["chunk_text"]),
+                "metadata": metadata
+            }
+
+    def upsert(self, vectors: List[dict], namespace: str) -> None:
+        self.calls += 1
+        store = self._namespaces.setdefault(namespace, {})
+        for vector in vectors:
+            store[vector["id"]] = {"values": list(vector["values"]), "metadata": dict(vector.get("metadata") or {})}
+
+    def _rank(self, namespace: str, vector: List[float], top_k: int, filter_dict: Optional[dict]) -> List[tuple]:
+        scored = []
+        for id, entry in self._namespaces.get(namespace, {}).items():
+            if not _matches(entry["metadata"], filter_dict):
+                continue
+            scored.append((sum(a * b for a, b in zip(vector, entry["values"])), id, entry))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:top_k]
+
+    def query(self, namespace: str, vector: List[float], top_k: int, filter: Optional[dict] = None,
+              include_metadata: bool = False) -> SimpleNamespace:
+        self.calls += 1
+        return SimpleNamespace(matches=[
+            SimpleNamespace(id=id, score=score, metadata=dict(entry["metadata"]) if include_metadata else None)
+            for score, id, entry in self._rank(namespace, vector, top_k, filter)
+        ])
+
+    def search(self, namespace: str, query: dict) -> SimpleNamespace:
+        self.calls += 1
+        ranked = self._rank(namespace, self._embed(query["inputs"]["text"]), query["top_k"], query.get("filter"))
+        hits = [{"_id": id, "_score": score, "fields": dict(entry["metadata"])} for score, id, entry in ranked]
+        return SimpleNamespace(result=SimpleNamespace(hits=hits))
+
+    def list(self, namespace: str, prefix: str = "") -> Iterator[List[str]]:
+        self.calls += 1
+        ids = sorted(id for id in self._namespaces.get(namespace, {}) if id.startswith(prefix))
+        for start in range(0, len(ids), self.page_size):
+            yield ids[start:start + self.page_size]
+
+    def list_paginated(self, namespace: str, limit: Optional[int] = None, pagination_token: Optional[str] = None, prefix: str = "") -> SimpleNamespace:
+        self.calls += 1
+        limit = limit or self.page_size
+        ids = sorted(id for id in self._namespaces.get(namespace, {}) if id.startswith(prefix))
+        start = int(pagination_token or 0)
+        next_token = str(start + limit) if start + limit < len(ids) else None
+        return SimpleNamespace(
+            vectors=[SimpleNamespace(id=id) for id in ids[start:start + limit]],
+            pagination=SimpleNamespace(next=next_token) if next_token else None
+        )
+
+    def fetch(self, ids: List[str], namespace: str) -> SimpleNamespace:
+        self.calls += 1
+        store = self._namespaces.get(namespace, {})
+        return SimpleNamespace(vectors={
+            id: SimpleNamespace(id=id, values=store[id]["values"], metadata=dict(store[id]["metadata"]))
+            for id in ids if id in store
+        })
+
+    def describe_index_stats(self) -> SimpleNamespace:
+        self.calls += 1
+        return SimpleNamespace(
+            dimension=self.dimension,
+            namespaces={ns: SimpleNamespace(vector_count=len(v)) for ns, v in self._namespaces.items() if v}
+        )
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = "") -> None:
+        self.calls += 1
+        if delete_all:
+            self._namespaces.pop(namespace, None)
+            return
+        store = self._namespaces.get(namespace, {})
+        for id in ids or []:
+            store.pop(id, None)
@@ -1,12 +1,68 @@
 import os
 import uuid
+import asyncio
 from pinecone import Pinecone
-from typing import List
+from typing import AsyncIterator, List, Optional, Tuple
 from datetime import datetime
+from urllib.parse import quote
+from app.services.embedding import EmbeddingService, EMBED_MODEL
+from app.services.cache import Cache, NullCache, create_cache
     
 
+# Pinecone caps upsert_records on integrated-embedding indexes at 96 records per call
+MAX_UPSERT_BATCH = 96
+
+# Namespace listings change only when a user stores their first memory or is
+# cleared, both of which invalidate it; the TTL bounds drift from other writers
+NAMESPACE_CACHE_TTL_S = 60
+
+# Memory IDs start with the time they were written, inverted, so Pinecone's
+# lexicographic ID listing returns a namespace newest first and reading recent
+# history only needs the first list page. Random (uuid) IDs from older versions
+# never start with the prefix and sort before every prefixed ID.
+TIME_ID_PREFIX = "t"
+_MAX_TIME_MS = 10 ** 13 - 1
+# Pinecone returns at most 100 IDs per list page
+LIST_PAGE_SIZE = 100
+
+
+def ms_timestamp(timestamp: float) -> float:
+    """Round a timestamp to the millisecond precision kept in memory IDs"""
+    return round(timestamp * 1000) / 1000
+
+
+def time_ordered_id(timestamp: float, suffix: str) -> str:
+    """Memory ID that sorts newest first; `timestamp` should already be ms-rounded"""
+    return f"{TIME_ID_PREFIX}{_MAX_TIME_MS - round(timestamp * 1000):013d}-{suffix}"
+
+
+def id_timestamp(memory_id: str) -> float:
+    """Timestamp encoded in a time_ordered_id"""
+    return (_MAX_TIME_MS - int(memory_id[len(TIME_ID_PREFIX):len(TIME_ID_PREFIX) + 13])) / 1000
+
+
+def _newest_first(timestamp: float, memory_id: str) -> Tuple[float, str]:
+    """Sort key putting messages newest first; the ID breaks timestamp ties.
+
+    For time-ordered IDs this is the same order as the IDs themselves.
+    """
+    return (-timestamp, memory_id)
+
+
 class MemoryService:
-    def __init__(self):
+    def __init__(self, index=None, embedding: Optional[EmbeddingService] = None, cache: Optional[Cache] = None,
+                 cache_scope: str = "local"):
+        # Sizes of the newest-message tails served so far, so a store can update each cached tail
+        self._tail_limits = set()
+
+        # An index and embedder can be passed in directly (e.g. LocalIndex for offline evaluation)
+        if index is not None:
+            self.index = index
+            self.embedding = embedding
+            self.cache = cache or NullCache()
+            self.cache_scope = quote(cache_scope, safe="")
+            return
+
         # Initialize Pinecone
         pinecone_api_key = os.getenv("PINECONE_API_KEY")
         
@@ -21,37 +77,122 @@ class MemoryService:
                 cloud="aws",
                 region="us-east-1",
                 embed={
-                    "model":"llama-text-embed-v2",
+                    "model":EMBED_MODEL,
                     "field_map":{"text": "chunk_text"}
                 }
             )
         
         # Connect to the index
         self.index = pinecone.Index(index_name)
+        self.embedding = embedding or EmbeddingService(pinecone=pinecone)
+        self.cache = cache or create_cache()
+        # Every key is prefixed with the index host (unique per project and index), so
+        # deployments sharing a host and cache file never read each other's data
+        self.cache_scope = quote(pinecone.describe_index(index_name).host, safe="")
+
+    def _generation_key(self, user_id: str) -> str:
+        return f"{self.cache_scope}:{quote(user_id, safe='')}"
+
+    def _user_cache_key(self, user_id: str, name: str, generation: Optional[int] = None) -> str:
+        """Cache key for per-user data, tied to the user's current (or the given) generation"""
+        if generation is None:
+            generation = self.cache.generation(self._generation_key(user_id))
+        return f"{self.cache_scope}:user:{quote(user_id, safe='')}:{generation}:{name}"
+
+    def _invalidate_user(self, user_id: str) -> int:
+        """Drop cached per-user data after a write and return the new generation.
+
+        Bumping the generation also orphans values a concurrent reader computed
+        from the old data and writes back after this point.
+        """
+        self.cache.delete_prefix(f"{self.cache_scope}:user:{quote(user_id, safe='')}:")
+        return self.cache.bump_generation(self._generation_key(user_id))
+
+    def _write_through(self, user_id: str, new_entries: List[dict]) -> None:
+        """Invalidate after storing messages, carrying the cached tails forward.
+
+        Each cached tail of newest messages is re-written under the new generation
+        with the new messages appended and trimmed back to its size, so the next
+        turn's read still hits and the work per store does not grow with the
+        conversation. Tails are only carried forward when no other write bumped
+        the generation in between.
+        """
+        generation = self.cache.generation(self._generation_key(user_id))
+        tails = {
+            limit: self.cache.get(self._user_cache_key(user_id, f"tail:{limit}", generation))
+            for limit in self._tail_limits
+        }
+        new_generation = self._invalidate_user(user_id)
+        if new_generation != generation + 1:
+            return
+
+        for limit, cached in tails.items():
+            if cached is None:
+                continue
+            entries, has_more = cached
+            # A reader may have cached a tail that already includes these messages
+            known = {entry['id'] for entry in entries}
+            entries = entries + [entry for entry in new_entries if entry['id'] not in known]
+            entries.sort(key=lambda x: _newest_first(x['timestamp'], x['id']), reverse=True)
+            has_more = has_more or len(entries) > limit
+            self.cache.set(self._user_cache_key(user_id, f"tail:{limit}", new_generation), [entries[-limit:], has_more])
+
+    def _namespace_names(self) -> List[str]:
+        """Names of all namespaces in the index, cached across workers"""
+        names = self.cache.get(f"{self.cache_scope}:namespaces")
+        if names is None:
+            names = sorted(self.index.describe_index_stats().namespaces.keys())
+            self.cache.set(f"{self.cache_scope}:namespaces", names, ttl=NAMESPACE_CACHE_TTL_S)
+        return names
     
     
-    async def store_memory(self, user_id: str, content: str, role: str) -> str:
-        """Store a new memory in the vector store"""
+    async def store_memories(self, user_id: str, messages: List[dict], vectors: Optional[List[List[float]]] = None) -> List[str]:
+        """Store several messages with one embedding call and one upsert.
+
+        Each message is a dict with `content`, `role` and optionally `timestamp`.
+        Pass `vectors` when the passages were already embedded.
+        """
+        if vectors is None:
+            vectors = await self.embedding.embed([m["content"] for m in messages], "passage")
 
-        memory_id = str(uuid.uuid4())
-        print(f"Storing memory with ID: {memory_id} for user: {user_id}")
-        self.index.upsert_records(
-            records=[
-                {
-                    "id": memory_id,
-                    "chunk_text": content,
-                    "timestamp": datetime.now().timestamp(),
-                    "role": role,
+        memory_ids = []
+        upserts = []
+        entries = []
+        for message, vector in zip(messages, vectors):
+            timestamp = ms_timestamp(message.get("timestamp") or datetime.now().timestamp())
+            memory_id = time_ordered_id(timestamp, str(uuid.uuid4()))
+            memory_ids.append(memory_id)
+            upserts.append({
+                "id": memory_id,
+                "values": vector,
+                "metadata": {
+                    "chunk_text": message["content"],
+                    "timestamp": timestamp,
+                    "role": message["role"],
                     "id_for_filter": memory_id
                 }
-            ],
-            namespace=user_id
-        )
-        print(f"Memory stored successfully with ID: {memory_id}")
-        return memory_id
+            })
+            entries.append({'id': memory_id, 'timestamp': timestamp, 'content': message["content"], 'role': message["role"]})
+        print(f"Storing memories with IDs: {memory_ids} for user: {user_id}")
+        await asyncio.to_thread(self.index.upsert, vectors=upserts, namespace=user_id)
+        self._write_through(user_id, entries)
+        names = self.cache.get(f"{self.cache_scope}:namespaces")
+        if names is not None and user_id not in names:
+            self.cache.delete(f"{self.cache_scope}:namespaces")
+        print(f"Memories stored successfully with IDs: {memory_ids}")
+        return memory_ids
+
+    async def store_memory(self, user_id: str, content: str, role: str) -> str:
+        """Store a new memory in the vector store"""
+        memory_ids = await self.store_memories(user_id, [{"content": content, "role": role}])
+        return memory_ids[0]
     
-    async def search_memories(self, user_id: str, query: str, limit: int = 5, exclude_ids: List[str] = None) -> List[dict]:
-        """Search for relevant memories using semantic search"""
+    async def search_memories(self, user_id: str, query: str, limit: int = 5, exclude_ids: List[str] = None,
+                              vector: Optional[List[float]] = None) -> List[dict]:
+        """Search for relevant memories using semantic search.
+
+        Pass `vector` when the query was already embedded; otherwise it is embedded here.
+        """
         try:
             # Build filter based on exclude_ids
             filter_dict = {}
@@ -59,30 +200,37 @@ class MemoryService:
                 filter_dict = {
                     "id_for_filter": {"$nin": exclude_ids}
                 }
+
+            if vector is None:
+                vector = (await self.embedding.embed([query], "query"))[0]
             
             # Query Pinecone
-            results = self.index.search(
+            # Run off the event loop so other requests' timeouts can still fire
+            results = await asyncio.to_thread(
+                self.index.query,
                 namespace=user_id,
-                query={
-                    "top_k": limit,
-                    "inputs": {
-                        "text": query
-                    },
-                    "filter": filter_dict
-                }
+                vector=vector,
+                top_k=limit,
+                filter=filter_dict or None,
+                include_metadata=True
             )
             
-            print(results.result.hits)
-            return results.result.hits
+            # Same shape as the hits returned by index.search
+            hits = [
+                {"_id": match.id, "_score": match.score, "fields": dict(match.metadata or {})}
+                for match in results.matches
+            ]
+            print(hits)
+            return hits
         except Exception as e:
             print(f"Error searching memories: {str(e)}")
             return []
     
     def _namespace_exists(self, user_id: str) -> bool:
         """Check if a namespace exists for a user"""
-        namespaces = self.index.describe_index_stats()
+        namespaces = self._namespace_names()
         print(f"Available namespaces: {namespaces}")
-        return namespaces.namespaces.get(user_id) is not None
+        return user_id in namespaces
             
     async def clear_memories(self, user_id: str) -> bool:
         """Clear all memories for a user"""
@@ -118,39 +266,180 @@ class MemoryService:
         except Exception as e:
             print(f"Error clearing memories: {str(e)}")
             return False
+        finally:
+            self._invalidate_user(user_id)
+            self.cache.delete(f"{self.cache_scope}:namespaces")
     
+    def _list_all_ids(self, user_id: str) -> List[str]:
+        """List every vector ID in a user's namespace, following all pages"""
+        ids = []
+        for page in self.index.list(namespace=user_id):
+            ids.extend(id for id in page if id is not None)
+        return ids
+
+    def _fetch_entries(self, user_id: str, ids: List[str], batch_size: int = 100) -> List[dict]:
+        """Fetch stored messages by ID in batches and return them oldest first"""
+        entries = []
+        for start in range(0, len(ids), batch_size):
+            data = self.index.fetch(ids[start:start + batch_size], namespace=user_id)
+            for id, vector_data in data.vectors.items():
+                entries.append({
+                    'id': id,
+                    'timestamp': vector_data.metadata.get("timestamp", 0),
+                    'content': vector_data.metadata.get("chunk_text", ""),
+                    'role': vector_data.metadata.get("role", "user")
+                })
+        entries.sort(key=lambda x: _newest_first(x['timestamp'], x['id']), reverse=True)
+        return entries
+
+    async def get_history_page(self, user_id: str, limit: int = 50, before: Optional[float] = None,
+                               before_id: Optional[str] = None) -> Tuple[List[dict], bool]:
+        """Return the newest `limit` messages older than the (`before`, `before_id`) cursor.
+
+        Without `before` this is the most recent page, served from the cache. Pass the timestamp and ID of
+        the oldest message already loaded to walk back in time; unlike an offset this
+        stays stable while new messages are stored, and the ID keeps messages that
+        share a timestamp from being skipped at a page boundary. Messages within the
+        page are ordered oldest first. Also returns whether older messages remain.
+        """
+        if before is None:
+            return await self._recent_entries(user_id, limit)
+        # Without an ID only messages strictly older than `before` qualify
+        cursor = (before, before_id if before_id is not None else chr(0x10FFFF))
+        return await asyncio.to_thread(self._read_page, user_id, limit, cursor)
+
+    async def _recent_entries(self, user_id: str, limit: int) -> Tuple[List[dict], bool]:
+        """Newest `limit` messages and whether older ones exist, cached and kept up to date by store_memories"""
+        self._tail_limits.add(limit)
+        cache_key = self._user_cache_key(user_id, f"tail:{limit}")
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached[0], cached[1]
+        entries, has_more = await asyncio.to_thread(self._read_page, user_id, limit)
+        self.cache.set(cache_key, [entries, has_more])
+        return entries, has_more
+
     async def get_history(self, user_id: str, limit: int = 15) -> List[dict]:
-        ids = self.index.list(namespace=user_id)
-        print(f"Fetched IDs: {ids}")
-        ids = [id for id in ids if id is not None]
-        if ids == []:
-            return [], []
-        ids = ids[0]
-    
-        print(f"IDs: {ids}")
-        data = self.index.fetch(ids, namespace=user_id)
-        
-        # Convert to list of dictionaries and sort by metadata text
-        history = []
-        for id, vector_data in data.vectors.items():
-            history.append({
-                'id': id,
-                'timestamp': vector_data.metadata.get("timestamp",0),
-                'text': vector_data.metadata.get("chunk_text",""),
-                'role': vector_data.metadata.get("role", "user")
-            })
-        
-        # Sort by text in metadata
-        history.sort(key=lambda x: x['timestamp'], reverse=True)
-        history = history[:limit]
-        history.reverse()
-        print("HOWOHWO", history)
-        ids = [entry.pop('id') for entry in history]
-        print(ids)
-        # remove timestamp and id and rename text to parts also make it a list
-        for entry in history:
-            entry['parts'] = [entry.pop('text')]
-            entry.pop('timestamp')
+        """Recent history in Gemini chat format plus the IDs it covers"""
+        entries, _ = await self._recent_entries(user_id, limit)
+        ids = [entry['id'] for entry in entries]
+        history = [{'role': entry['role'], 'parts': [entry['content']]} for entry in entries]
         print(f"History: {history}")
-        return history[:limit], ids
-    
\ No newline at end of file
+        return history, ids
+
+    def _read_page(self, user_id: str, limit: int, before: Optional[Tuple[float, str]] = None) -> Tuple[List[dict], bool]:
+        """Newest `limit` messages past the `before` (timestamp, id) cursor, oldest first,
+        plus whether older ones remain. Blocking; run it through asyncio.to_thread.
+
+        With time-ordered IDs only the ID pages down to the cursor are listed and only
+        the returned records are fetched; the latest page is one list call and one
+        fetch. Namespaces holding IDs from before that scheme fall back to fetching
+        every record.
+        """
+        cursor = _newest_first(*before) if before is not None else None
+        ids, token = [], None
+        while True:
+            page = self.index.list_paginated(namespace=user_id, limit=LIST_PAGE_SIZE, pagination_token=token)
+            page_ids = [v.id for v in page.vectors]
+            if token is None and page_ids and not page_ids[0].startswith(TIME_ID_PREFIX):
+                return self._scan_page(user_id, limit, cursor)
+            ids.extend(
+                id for id in page_ids
+                if id.startswith(TIME_ID_PREFIX) and (cursor is None or _newest_first(id_timestamp(id), id) > cursor)
+            )
+            token = page.pagination.next if page.pagination else None
+            if len(ids) > limit or not token:
+                break
+        return self._fetch_entries(user_id, ids[:limit]), len(ids) > limit
+
+    def _scan_page(self, user_id: str, limit: int, cursor: Optional[Tuple[float, str]]) -> Tuple[List[dict], bool]:
+        """_read_page for namespaces whose IDs carry no time order"""
+        entries = self._fetch_entries(user_id, self._list_all_ids(user_id))
+        if cursor is not None:
+            entries = [e for e in entries if _newest_first(e['timestamp'], e['id']) > cursor]
+        start = max(len(entries) - limit, 0)
+        return entries[start:], start > 0
+
+    async def export_records(
+        self,
+        user_id: Optional[str] = None,
+        page_size: int = 100,
+        start_namespace: Optional[str] = None,
+        pagination_token: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """Stream stored records one ID page at a time.
+
+        Walks a single namespace when user_id is given, otherwise every namespace in
+        sorted order. After each page a {"checkpoint": {...}} item is yielded; passing
+        its namespace and pagination_token back in resumes the export from that point.
+        """
+        if user_id:
+            namespaces = [user_id]
+        else:
+            namespaces = await asyncio.to_thread(self._namespace_names)
+        if start_namespace:
+            namespaces = [ns for ns in namespaces if ns >= start_namespace]
+
+        for position, namespace in enumerate(namespaces):
+            token = pagination_token if namespace == start_namespace else None
+            while True:
+                page = await asyncio.to_thread(
+                    self.index.list_paginated,
+                    namespace=namespace,
+                    limit=page_size,
+                    pagination_token=token
+                )
+                ids = [v.id for v in page.vectors]
+                if ids:
+                    data = await asyncio.to_thread(self.index.fetch, ids, namespace=namespace)
+                    for id, vector_data in data.vectors.items():
+                        yield {
+                            "id": id,
+                            "namespace": namespace,
+                            "chunk_text": vector_data.metadata.get("chunk_text", ""),
+                            "role": vector_data.metadata.get("role", "user"),
+                            "timestamp": vector_data.metadata.get("timestamp", 0)
+                        }
+                token = page.pagination.next if page.pagination else None
+                if token:
+                    yield {"checkpoint": {"namespace": namespace, "pagination_token": token}}
+                    continue
+                if position + 1 < len(namespaces):
+                    yield {"checkpoint": {"namespace": namespaces[position + 1], "pagination_token": None}}
+                break
+
+    async def import_records(self, records: List[dict], namespace: str) -> int:
+        """Upsert one batch of exported records into a namespace, keeping their IDs"""
+        batch = []
+        for record in records:
+            # Records without an ID get one derived from their content, so
+            # replaying or resuming the same file overwrites instead of duplicating
+            memory_id = record.get("id")
+            timestamp = record.get("timestamp")
+            if not memory_id:
+                suffix = str(uuid.uuid5(
+                    uuid.NAMESPACE_OID,
+                    f"{namespace}\0{timestamp or ''}\0{record.get('role', 'user')}\0{record['chunk_text']}"
+                ))
+                if timestamp:
+                    timestamp = ms_timestamp(timestamp)
+                    memory_id = time_ordered_id(timestamp, suffix)
+                else:
+                    # A time prefix taken from the clock would differ on every replay
+                    memory_id = suffix
+            batch.append({
+                "id": memory_id,
+                "chunk_text": record["chunk_text"],
+                "timestamp": timestamp or datetime.now().timestamp(),
+                "role": record.get("role", "user"),
+                "id_for_filter": memory_id
+            })
+        for start in range(0, len(batch), MAX_UPSERT_BATCH):
+            await asyncio.to_thread(
+                self.index.upsert_records,
+                records=batch[start:start + MAX_UPSERT_BATCH],
+                namespace=namespace
+            )
+        self._invalidate_user(namespace)
+        self.cache.delete(f"{self.cache_scope}:namespaces")
+        return len(batch)
@@ -0,0 +1,164 @@
+"""Offline latency/recall sweep for the memory retrieval settings.
+
+Loads synthetic conversations (eval/synthetic.py) into a LocalIndex through
+MemoryService, then replays the agent's retrieval step (history + memory search)
+for every labeled question under each combination of settings and prints the
+Pareto-optimal ones.
+
+Run from the backend directory:
+    python -m eval.retrieval_eval [--conversations 20] [--rtt-ms 25] [--all]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import time
+import uuid
+from typing import List, Tuple
+
+from app.services.embedding import EmbeddingService
+from app.services.local_index import LocalIndex, local_embed
+from app.services.memory import MemoryService, time_ordered_id
+from eval.synthetic import build_dataset
+
+# Settings swept; production values are MEMORY_TOP_K, MAX_SEARCH_QUERIES and HISTORY_LIMIT
+TOP_K = [1, 3, 5, 10]
+QUERY_COUNTS = [1, 2, 3]
+HISTORY_LIMITS = [5, 10, 15, 30]
+# Whether history IDs and earlier hits are excluded from later searches (the $nin filter)
+EXCLUDE_FILTER = [True, False]
+PRODUCTION = (5, 3, 15, True)
+
+
+async def load_dataset(memory: MemoryService, dataset) -> List[Tuple[str, List[dict]]]:
+    """Store every conversation in its own namespace and tag questions with the answering memory ID"""
+    users = []
+    for number, (turns, questions) in enumerate(dataset):
+        user_id = f"eval-{number}"
+        records = [
+            {"id": time_ordered_id(1_700_000_000 + position, str(uuid.uuid4())), "chunk_text": text, "role": role,
+             "timestamp": 1_700_000_000 + position}
+            for position, (role, text) in enumerate(turns)
+        ]
+        await memory.import_records(records, user_id)
+        for question in questions:
+            question["memory_id"] = records[question["turn"]]["id"]
+        users.append((user_id, questions))
+    return users
+
+
+async def evaluate(memory: MemoryService, index: LocalIndex, users, top_k: int, query_count: int,
+                   history_limit: int, exclude_filter: bool, rtt_ms: float) -> dict:
+    """Replay the agent's retrieval for every question under one setting and aggregate the metrics.
+
+    A question counts as recalled when its fact reaches the reply prompt, either in
+    the history window (rank 1) or among the memory hits (rank = position in the prompt).
+    """
+    recalled, reciprocal_ranks, latency_ms, calls, prompt_chars, total = 0, 0.0, 0.0, 0, 0, 0
+    for user_id, questions in users:
+        for question in questions:
+            calls_before = index.calls + memory.embedding.calls
+            started = time.perf_counter()
+
+            history, history_ids = await memory.get_history(user_id, limit=history_limit)
+            exclude_ids = list(history_ids)
+            hits, hit_ids = [], []
+            queries = question["queries"][:query_count]
+            vectors = await memory.embedding.embed(queries, "query")
+            for query, vector in zip(queries, vectors):
+                results = await memory.search_memories(
+                    user_id, query, limit=top_k, exclude_ids=exclude_ids if exclude_filter else None, vector=vector
+                )
+                for mem in results:
+                    exclude_ids.append(mem["_id"])
+                    hit_ids.append(mem["_id"])
+                    hits.append(mem["fields"]["chunk_text"])
+
+            round_trips = index.calls + memory.embedding.calls - calls_before
+            latency_ms += (time.perf_counter() - started) * 1000 + round_trips * rtt_ms
+            calls += round_trips
+            # Same shape as the history and memory sections of the reply prompt in Agent._respond
+            prompt_chars += len(str(history)) + sum(len(f"- {mem}\n") for mem in hits)
+
+            if question["memory_id"] in history_ids:
+                rank = 1
+            elif question["memory_id"] in hit_ids:
+                rank = hit_ids.index(question["memory_id"]) + 1
+            else:
+                rank = None
+            if rank:
+                recalled += 1
+                reciprocal_ranks += 1 / rank
+            total += 1
+
+    return {
+        "top_k": top_k,
+        "queries": query_count,
+        "history": history_limit,
+        "exclude": exclude_filter,
+        "recall": recalled / total,
+        "mrr": reciprocal_ranks / total,
+        "latency_ms": latency_ms / total,
+        "calls": calls / total,
+        "prompt_chars": prompt_chars / total,
+    }
+
+
+def pareto_front(results: List[dict]) -> List[dict]:
+    """Settings not beaten on every objective (recall, MRR up; latency, prompt size down) by another"""
+    def dominates(a, b):
+        no_worse = (a["recall"] >= b["recall"] and a["mrr"] >= b["mrr"]
+                    and a["latency_ms"] <= b["latency_ms"] and a["prompt_chars"] <= b["prompt_chars"])
+        better = (a["recall"] > b["recall"] or a["mrr"] > b["mrr"]
+                  or a["latency_ms"] < b["latency_ms"] or a["prompt_chars"] < b["prompt_chars"])
+        return no_worse and better
+    return [r for r in results if not any(dominates(other, r) for other in results)]
+
+
+def print_report(rows: List[dict], title: str) -> None:
+    print(f"\n{title}")
+    header = f"{'':1} {'top_k':>5} {'queries':>7} {'history':>7} {'exclude':>7} {'recall':>7} {'mrr':>6} {'latency_ms':>10} {'calls':>6} {'prompt_chars':>12} {'~tokens':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in sorted(rows, key=lambda r: (-r["recall"], r["latency_ms"], r["prompt_chars"])):
+        marker = "*" if (r["top_k"], r["queries"], r["history"], r["exclude"]) == PRODUCTION else ""
+        print(f"{marker:1} {r['top_k']:>5} {r['queries']:>7} {r['history']:>7} {str(r['exclude']):>7} "
+              f"{r['recall']:>7.3f} {r['mrr']:>6.3f} {r['latency_ms']:>10.1f} {r['calls']:>6.1f} "
+              f"{r['prompt_chars']:>12.0f} {r['prompt_chars'] / 4:>8.0f}")
+
+
+async def main(args) -> None:
+    dataset = build_dataset(args.conversations, args.facts, args.filler_turns, args.seed)
+    index = LocalIndex()
+    # No embedding cache, so every setting pays for its own query embedding call
+    memory = MemoryService(index=index, embedding=EmbeddingService(embed_fn=local_embed, max_entries=0))
+
+    results = []
+    # MemoryService logs every call; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        users = await load_dataset(memory, dataset)
+        for top_k, query_count, history_limit, exclude_filter in itertools.product(
+            TOP_K, QUERY_COUNTS, HISTORY_LIMITS, EXCLUDE_FILTER
+        ):
+            results.append(await evaluate(
+                memory, index, users, top_k, query_count, history_limit, exclude_filter, args.rtt_ms
+            ))
+
+    questions = sum(len(q) for _, q in users)
+    print(f"{len(users)} conversations, {questions} labeled questions, {args.rtt_ms:.0f} ms simulated round trip per index or embedding call")
+    print("* = current production defaults (MEMORY_TOP_K=5, MAX_SEARCH_QUERIES=3, HISTORY_LIMIT=15)")
+    if args.all:
+        print_report(results, "All settings")
+    print_report(pareto_front(results), "Pareto front (recall/MRR vs latency vs prompt size)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--facts", type=int, default=4, help="facts per conversation")
+    parser.add_argument("--filler-turns", type=int, default=30, help="chit-chat exchanges per conversation")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--rtt-ms", type=float, default=25.0, help="simulated network round trip added per index or embedding call")
+    parser.add_argument("--all", action="store_true", help="print every setting, not just the Pareto front")
+    asyncio.run(main(parser.parse_args()))
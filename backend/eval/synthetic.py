@@ -0,0 +1,97 @@
+import random
+from typing import List, Tuple
+
+# Each fact is something the user says once and asks about later:
+# (statement, later question, search queries in the order a query generator might write them,
+# vaguest first, so running fewer queries costs recall)
+FACTS = [
+    ("My dog is a beagle called Biscuit.", "What was my dog called again?",
+     ["pet name", "dog I mentioned", "beagle"]),
+    ("I'm allergic to peanuts, so keep that in mind for recipes.", "Can you remind me what food I'm allergic to?",
+     ["food I can't eat", "recipe restrictions", "allergic"]),
+    ("My sister Laura lives in Lisbon.", "Which city does my sister live in?",
+     ["family city", "where sister lives", "Laura"]),
+    ("I'm training for the Berlin marathon in September.", "Which race am I training for?",
+     ["running plans", "race in September", "marathon training"]),
+    ("Our team migrated the billing service from MySQL to Postgres.", "What database did we move billing to?",
+     ["database choice", "MySQL Postgres migration", "billing service"]),
+    ("My favourite book is The Left Hand of Darkness.", "What did I say my favourite book was?",
+     ["book recommendation", "science fiction book", "favourite book"]),
+    ("I drive a blue 2014 Honda Civic.", "What car do I drive?",
+     ["car details", "my car model", "Honda"]),
+    ("My daughter's birthday is on the 3rd of March.", "When is my daughter's birthday?",
+     ["birthday date", "family birthday", "daughter"]),
+    ("I play bass guitar in a jazz trio on weekends.", "What instrument do I play?",
+     ["music hobby", "guitar practice", "jazz trio"]),
+    ("The wifi password at the cabin is pinecone42.", "What's the cabin wifi password?",
+     ["password", "wifi password", "cabin"]),
+    ("My manager is called Priya and she prefers written updates.", "How does my manager like to get updates?",
+     ["work updates", "manager preferences", "Priya"]),
+    ("I'm learning Japanese and just passed JLPT N4.", "Which language exam did I pass?",
+     ["language learning", "exam result", "Japanese"]),
+    ("Our flat's rent goes up to 1450 euros in January.", "How much will our rent be?",
+     ["landlord", "rent price", "flat rent January"]),
+    ("I take my coffee black with no sugar.", "How do I take my coffee?",
+     ["drink preference", "coffee", "black no sugar"]),
+    ("The project deadline for the Atlas redesign is the 14th.", "When is the Atlas redesign due?",
+     ["project due date", "redesign deadline", "Atlas"]),
+    ("My grandmother's soup recipe uses smoked paprika and leeks.", "What goes into my grandmother's soup?",
+     ["family recipe", "soup ingredients", "grandmother"]),
+]
+
+# Chit-chat turns that fill the conversation around the facts; most share
+# words with some fact so that the first, vaguer queries and a small top_k can miss
+FILLER = [
+    ("Can you suggest a quick dinner recipe?", "Sure, try a tomato and chickpea stew; it takes about 20 minutes."),
+    ("What's a good stretch after running?", "A standing quad stretch and a calf stretch against a wall work well."),
+    ("How do I write a polite follow-up email with work updates?", "Keep it short, restate the ask, and offer a specific next step."),
+    ("Any tips for language learning?", "Practise a little every day and use spaced-repetition flashcards."),
+    ("What's the difference between MySQL and Postgres?", "Postgres has richer types and stricter SQL; MySQL is simpler to operate."),
+    ("My neighbour's dog barks all night.", "That sounds frustrating; a friendly conversation is usually the best first step."),
+    ("Recommend a science fiction book.", "Try 'The Dispossessed' by Ursula K. Le Guin."),
+    ("How often should my car get an oil change?", "Most modern cars need one every 10,000 to 15,000 km."),
+    ("How do I reset my router's wifi password?", "Log into the router admin page, usually at 192.168.1.1, and change it under wireless settings."),
+    ("What's a good birthday gift for a coworker?", "A nice notebook or a gift card for a local cafe is usually safe."),
+    ("Is coffee bad for sleep?", "Caffeine can affect sleep for up to eight hours, so avoid it in the afternoon."),
+    ("How should I prepare for a project retrospective before the due date?", "Collect what went well, what didn't, and one or two concrete actions."),
+    ("What's the weather usually like in September?", "Generally mild, with cooler evenings in the north."),
+    ("Give me a tip for guitar practice.", "Use a metronome and practise slowly before building speed."),
+    ("How do I ask my landlord for a repair in the flat?", "Put the request in writing with photos and a reasonable deadline."),
+    ("What's a healthy snack?", "Greek yoghurt with berries or a handful of almonds."),
+    ("Which pet is easier to look after, a cat or a dog?", "Cats are generally more independent; dogs need walks and company."),
+    ("How do I pick a strong password?", "Use a long passphrase of unrelated words and a password manager."),
+    ("What's a good family recipe to cook with kids?", "Homemade pizza is fun: everyone can add their own toppings."),
+    ("How do I keep track of family birthday dates?", "Put them in a shared calendar with a reminder a week before."),
+    ("Which exam result do universities look at most?", "It varies, but final-year grades usually carry the most weight."),
+    ("What drink helps with a sore throat?", "Warm water with honey and lemon is soothing."),
+]
+
+Turn = Tuple[str, str]  # (role, text)
+
+
+def build_conversation(rng: random.Random, facts_per_conversation: int, filler_turns: int) -> Tuple[List[Turn], List[dict]]:
+    """Build one conversation as a list of (role, text) turns, plus the questions to ask after it.
+
+    Facts are placed at random positions among the filler exchanges; each question
+    records which turn index holds the fact that answers it.
+    """
+    facts = rng.sample(FACTS, facts_per_conversation)
+    exchanges = [rng.choice(FILLER) for _ in range(filler_turns)]
+    positions = sorted(rng.sample(range(filler_turns + facts_per_conversation), facts_per_conversation))
+    for position, (statement, _, _) in zip(positions, facts):
+        exchanges.insert(position, (statement, "Got it, I'll remember that."))
+
+    turns: List[Turn] = []
+    questions = []
+    for user_text, model_text in exchanges:
+        for fact in facts:
+            if fact[0] == user_text:
+                questions.append({"question": fact[1], "queries": fact[2], "turn": len(turns)})
+        turns.append(("user", user_text))
+        turns.append(("model", model_text))
+    return turns, questions
+
+
+def build_dataset(conversations: int, facts_per_conversation: int = 4, filler_turns: int = 30, seed: int = 7) -> List[Tuple[List[Turn], List[dict]]]:
+    rng = random.Random(seed)
+    return [build_conversation(rng, facts_per_conversation, filler_turns) for _ in range(conversations)]
@@ -1,5 +1,15 @@
+import uuid
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connect timeout / read timeout for backend calls (a memory turn can take a while)
+REQUEST_TIMEOUT = (3.05, 120)
+HISTORY_PAGE_SIZE = 50
+# Attempts per turn when the connection to the backend fails; every attempt
+# reuses the turn's idempotency key, so the backend runs the turn only once
+CHAT_SEND_ATTEMPTS = 2
 
 # Page config
 st.set_page_config(
@@ -8,12 +18,6 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- New: Single-message lock ---
-if 'message_pending' not in st.session_state:
-    st.session_state.message_pending = False
-if 'pending_prompt' not in st.session_state:
-    st.session_state.pending_prompt = None
-
 # Authentication check
 if not st.user.is_logged_in:
     st.button("Log in with Google", on_click=st.login)
@@ -23,6 +27,87 @@ if not st.user.is_logged_in:
 if 'backend_url' not in st.session_state:
     st.session_state.backend_url = st.secrets.get("BACKEND_URL", "http://localhost:8000")
 
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Pooled keep-alive session shared by every script run and browser session"""
+    session = requests.Session()
+    # Only idempotent reads are retried; /chat and /clear_memories are sent once
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = get_http_session()
+
+def fetch_history(cursor=None):
+    """Load one page of stored conversation from the backend, oldest message first.
+
+    `cursor` holds the timestamp and ID of the oldest message already shown, so
+    messages sent during this session never shift the next page. Returns the
+    messages and the cursor for the page before them (None when there is none).
+    """
+    params = {"user_id": st.user.email, "limit": HISTORY_PAGE_SIZE}
+    if cursor is not None:
+        params.update(cursor)
+    try:
+        response = http.get(
+            f"{st.session_state.backend_url}/history",
+            params=params,
+            timeout=REQUEST_TIMEOUT
+        )
+        if response.status_code != 200:
+            return [], None
+        data = response.json()
+    except Exception:
+        return [], None
+    messages = [
+        {"role": "assistant" if m["role"] == "model" else m["role"], "content": m["content"]}
+        for m in data.get("messages", [])
+    ]
+    if data.get("next_before") is None:
+        return messages, None
+    return messages, {"before": data["next_before"], "before_id": data.get("next_before_id")}
+
+def send_chat(turn: dict) -> dict:
+    """Send one pending turn to the backend and return the assistant message to show.
+
+    Makes no st.* calls, so the caller can record the result in session state
+    before the next call that could be interrupted by a rerun.
+    """
+    for attempt in range(CHAT_SEND_ATTEMPTS):
+        try:
+            response = http.post(
+                f"{st.session_state.backend_url}/chat",
+                json={
+                    "user_id": st.session_state.user_id,
+                    "message": turn["message"],
+                    "use_memory": turn["use_memory"],
+                    "idempotency_key": turn["idempotency_key"]
+                },
+                timeout=REQUEST_TIMEOUT
+            )
+            break
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt + 1 == CHAT_SEND_ATTEMPTS:
+                return {"role": "assistant", "content": f"Error connecting to the server: {str(e)}", "error": True}
+        except Exception as e:
+            return {"role": "assistant", "content": f"Error connecting to the server: {str(e)}", "error": True}
+    if response.status_code != 200:
+        return {"role": "assistant", "content": "Sorry, I encountered an error processing your request.", "error": True}
+    data = response.json()
+    return {
+        "role": "assistant",
+        "content": data["response"],
+        "used_memory": data.get("used_memory", False),
+        "relevant_memories": data.get("relevant_memories", [])
+    }
+
+def render_memories(relevant_memories):
+    with st.expander("🔍 Used memory context"):
+        for memory in relevant_memories:
+            st.markdown(f'<div class="memory-badge">{memory}</div>', unsafe_allow_html=True)
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -70,13 +155,16 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Session state
+# Session state (preload the stored conversation once per login)
 if 'messages' not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages, st.session_state.history_cursor = fetch_history()
 if 'user_id' not in st.session_state:
     st.session_state.user_id = st.user.email
 if 'use_memory' not in st.session_state:
     st.session_state.use_memory = True
+# Turns sent but not yet answered; each keeps its idempotency key across reruns
+if 'pending_turns' not in st.session_state:
+    st.session_state.pending_turns = []
 
 # App title
 st.title("🤖 Chatbot with Memory")
@@ -90,10 +178,13 @@ with st.sidebar:
     
     if st.button("Clear Conversation"):
         st.session_state.messages = []
+        st.session_state.pending_turns = []
+        st.session_state.history_cursor = None
         try:
-            response = requests.post(
+            response = http.post(
                 f"{st.session_state.backend_url}/clear_memories",
-                json={"user_id": st.session_state.user_id}
+                json={"user_id": st.session_state.user_id},
+                timeout=REQUEST_TIMEOUT
             )
             if response.status_code == 200:
                 st.success("Conversation history cleared!")
@@ -112,71 +203,43 @@ with st.sidebar:
     and use that context to provide better responses.
     """)
 
+# Older messages are paged in on demand
+if st.session_state.get("history_cursor") is not None:
+    if st.button("Load earlier messages"):
+        older, st.session_state.history_cursor = fetch_history(st.session_state.history_cursor)
+        st.session_state.messages = older + st.session_state.messages
+
 # Display chat messages
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         if message.get("used_memory") and len(message.get("relevant_memories", [])) > 0:
-            with st.expander("🔍 Used memory context"):
-                for memory in message["relevant_memories"]:
-                    st.markdown(f'<div class="memory-badge">{memory}</div>', unsafe_allow_html=True)
+            render_memories(message["relevant_memories"])
 
-# New: disable chat input while waiting for a reply
-user_input = st.chat_input("Type your message here...", disabled=st.session_state.message_pending)
+user_input = st.chat_input("Type your message here...")
 
-# New: queue the prompt and trigger rerun
-if user_input and not st.session_state.message_pending:
-    st.session_state.pending_prompt = user_input
+# Send and render the turn in the same script run, no reruns needed
+if user_input:
     st.session_state.messages.append({"role": "user", "content": user_input})
-    st.session_state.message_pending = True
-    st.rerun()
+    st.session_state.pending_turns.append({
+        "message": user_input,
+        "use_memory": st.session_state.use_memory,
+        "idempotency_key": str(uuid.uuid4())
+    })
+    with st.chat_message("user"):
+        st.markdown(user_input)
 
-# New: if waiting on a prompt, handle the assistant response
-if st.session_state.message_pending and st.session_state.pending_prompt:
+# A turn left pending by an interrupted run is resent with the same key, so the
+# backend returns the original result instead of answering it twice
+while st.session_state.pending_turns:
+    turn = st.session_state.pending_turns[0]
     with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        try:
-            response = requests.post(
-                f"{st.session_state.backend_url}/chat",
-                json={
-                    "user_id": st.session_state.user_id,
-                    "message": st.session_state.pending_prompt,
-                    "use_memory": st.session_state.use_memory
-                }
-            )
-            if response.status_code == 200:
-                data = response.json()
-                full_response = data["response"]
-                used_memory = data.get("used_memory", False)
-                relevant_memories = data.get("relevant_memories", [])
-                message_placeholder.markdown(full_response)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": full_response,
-                    "used_memory": used_memory,
-                    "relevant_memories": relevant_memories
-                })
-                if used_memory and relevant_memories:
-                    with st.expander("🔍 Used memory context"):
-                        for memory in relevant_memories:
-                            st.markdown(f'<div class="memory-badge">{memory}</div>', unsafe_allow_html=True)
-            else:
-                error_msg = "Sorry, I encountered an error processing your request."
-                message_placeholder.markdown(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg,
-                    "error": True
-                })
-        except Exception as e:
-            error_msg = f"Error connecting to the server: {str(e)}"
-            message_placeholder.markdown(error_msg)
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": error_msg,
-                "error": True
-            })
-    # Reset pending state and rerun
-    st.session_state.pending_prompt = None
-    st.session_state.message_pending = False
-    st.rerun()
+        with st.spinner("Thinking..."):
+            reply = send_chat(turn)
+            # Record the reply before any further st.* call: submitting another
+            # message reruns the script at the next one and would drop it
+            st.session_state.messages.append(reply)
+            st.session_state.pending_turns.pop(0)
+        st.markdown(reply["content"])
+        if reply.get("used_memory") and reply.get("relevant_memories"):
+            render_memories(reply["relevant_memories"])